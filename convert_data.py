@@ -0,0 +1,8 @@
+import pandas as pd
+
+# ─────────────────────────────────────────────
+# One-off conversion of the source workbook to Parquet.
+# Re-run whenever data/budget_data.xlsx is updated.
+# ─────────────────────────────────────────────
+df = pd.read_excel("data/budget_data.xlsx")
+df.to_parquet("data/budget_data.parquet", index=False)
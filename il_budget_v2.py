@@ -1,7 +1,7 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
 
 # ─────────────────────────────────────────────
 # App Configuration
@@ -9,20 +9,6 @@ import plotly.graph_objects as go
 st.set_page_config(page_title="Illinois Budget Calculator v2", layout="wide")
 st.title("Illinois Budget Calculator v2.0")
 
-# ─────────────────────────────────────────────
-# Load Data
-# ─────────────────────────────────────────────
-@st.cache_data
-
-def load_data():
-    df = pd.read_excel("data/budget_data.xlsx")
-    df = df.dropna(subset=['Fund Category Name', 'Fund Name', 'FY25 Act Approp'])
-    df['FY25 Act Approp'] = pd.to_numeric(df['FY25 Act Approp'], errors='coerce')
-    df['FY25 Act Approp (M)'] = df['FY25 Act Approp'] / 1_000_000
-    return df
-
-df = load_data()
-
 # Define fund categories considered revenue-generating
 revenue_fund_cats = [
     "General Funds",
@@ -32,17 +18,43 @@ revenue_fund_cats = [
 ]
 
 # ─────────────────────────────────────────────
-# Preprocess for Treemap and Adjustments
+# Load Data and Preprocess for Treemap and Adjustments
 # ─────────────────────────────────────────────
-grouped_df = df.groupby(['Fund Category Name', 'Fund Name'], as_index=False).agg({
-    'FY25 Act Approp (M)': 'sum'
-})
+@st.cache_data
+def load_data():
+    df = pd.read_parquet(
+        "data/budget_data.parquet",
+        columns=['Fund Category Name', 'Fund Name', 'FY25 Act Approp']
+    )
+    df = df.dropna(subset=['Fund Category Name', 'Fund Name', 'FY25 Act Approp'])
+    df['Fund Category Name'] = df['Fund Category Name'].astype('category')
+    df['Fund Name'] = df['Fund Name'].astype('category')
+    df['FY25 Act Approp'] = df['FY25 Act Approp'].astype('float32')
+    df['FY25 Act Approp (M)'] = df['FY25 Act Approp'] / 1_000_000
+    df = df.drop(columns=['FY25 Act Approp'])
+
+    grouped_df = df.groupby(['Fund Category Name', 'Fund Name'], observed=True, as_index=False)['FY25 Act Approp (M)'].sum()
+
+    total_appropriation = grouped_df['FY25 Act Approp (M)'].sum()
+    category_totals = grouped_df.groupby('Fund Category Name', observed=True, sort=False)['FY25 Act Approp (M)'].sum()
+    grouped_df['Category Total'] = grouped_df['Fund Category Name'].map(category_totals).astype('float32')
+    grouped_df['Category % of Total'] = grouped_df['Category Total'] / total_appropriation * 100
+    grouped_df['Fund % of Category'] = grouped_df['FY25 Act Approp (M)'] / grouped_df['Category Total'] * 100
+
+    original_revenue = grouped_df.loc[grouped_df['Fund Category Name'].isin(revenue_fund_cats), 'FY25 Act Approp (M)'].sum()
+    original_spending = total_appropriation
+    return grouped_df, original_revenue, original_spending
+
+grouped_df, original_revenue, original_spending = load_data()
 
-total_appropriation = grouped_df['FY25 Act Approp (M)'].sum()
-grouped_df['Category Total'] = grouped_df.groupby('Fund Category Name')['FY25 Act Approp (M)'].transform('sum')
-grouped_df['Category % of Total'] = grouped_df['Category Total'] / total_appropriation * 100
-grouped_df['Fund % of Category'] = grouped_df['FY25 Act Approp (M)'] / grouped_df['Category Total'] * 100
-grouped_df['Label Value'] = grouped_df['FY25 Act Approp (M)'].apply(lambda val: f"${val:,.0f}M")
+# Boolean mask of revenue-generating rows, built once and shared by the UI and totals
+is_rev = grouped_df['Fund Category Name'].isin(revenue_fund_cats).to_numpy()
+
+# float32 appropriation values for the totals kernel, extracted once
+fund_values = grouped_df['FY25 Act Approp (M)'].to_numpy()
+
+# Fund categories in display order; read straight off the Categorical dtype
+categories = grouped_df['Fund Category Name'].cat.categories
 
 # Fund category descriptions (for info tooltips)
 category_info = {
@@ -56,202 +68,208 @@ category_info = {
     "Bond Financed Funds": "This is the Bond Financed Funds category."
 }
 
+# Category heading + info badge HTML, rendered once and reused by both tabs
+TOOLTIP_HTML = {
+    category: (
+        f"<span style='display:inline-flex; align-items:center; gap:8px;'>"
+        f"<b>{category}</b>"
+        f"<span title='{desc}' style='cursor:help;'>"
+        f"<span style='display:inline-block; width:16px; height:16px; border-radius:50%; border:1px solid #888; background-color:transparent; text-align:center; line-height:14px; font-size:12px;'>i</span>"
+        f"</span></span>"
+    )
+    for category, desc in category_info.items()
+}
+
 # ─────────────────────────────────────────────
 # Main: Treemap
 # ─────────────────────────────────────────────
 st.subheader("FY25 Appropriations by Fund Category and Fund (in Millions)")
 
-fig_tree = px.treemap(
-    grouped_df,
-    path=['Fund Category Name', 'Fund Name'],
-    values='FY25 Act Approp (M)'
-)
-
-fig_tree.update_traces(
-    texttemplate='%{label}<br>$%{value:,.0f}M',
-    customdata=grouped_df[['Fund Category Name', 'Fund Name', 'Category % of Total', 'Fund % of Category']].values,
-    hovertemplate=(
-        "<b>Category:</b> %{customdata[0]}<br>" +
-        "<b>Fund:</b> %{customdata[1]}<br>" +
-        "<b>Category Share of Total:</b> %{customdata[2]:.1f}%<br>" +
-        "<b>Fund Share of Category:</b> %{customdata[3]:.1f}%<br>" +
-        "<extra></extra>"
-    ),
-    marker=dict(line=dict(color='white', width=1), cornerradius=5),
-    textfont=dict(size=16)
-)
-
-st.plotly_chart(fig_tree, use_container_width=True)
+@st.cache_resource
+def build_treemap(df):
+    fig = px.treemap(
+        df,
+        path=['Fund Category Name', 'Fund Name'],
+        values='FY25 Act Approp (M)'
+    )
+
+    fig.update_traces(
+        texttemplate='%{label}<br>$%{value:,.0f}M',
+        customdata=df[['Fund Category Name', 'Fund Name', 'Category % of Total', 'Fund % of Category']].values,
+        hovertemplate=(
+            "<b>Category:</b> %{customdata[0]}<br>" +
+            "<b>Fund:</b> %{customdata[1]}<br>" +
+            "<b>Category Share of Total:</b> %{customdata[2]:.1f}%<br>" +
+            "<b>Fund Share of Category:</b> %{customdata[3]:.1f}%<br>" +
+            "<extra></extra>"
+        ),
+        marker=dict(line=dict(color='white', width=1), cornerradius=5),
+        textfont=dict(size=16)
+    )
+    return fig
+
+fig_tree = build_treemap(grouped_df)
+
+st.plotly_chart(fig_tree, width='stretch')
 
 # ─────────────────────────────────────────────
 # Interactive Adjustments UI
 # ─────────────────────────────────────────────
-tab_spending, tab_revenue = st.tabs(["Adjust Spending", "Adjust Revenue"])
-
-category_adjustments = {}
-fund_adjustments = {}
-
-spend_all = st.session_state.get("spend_all", 0.0)
-rev_all = st.session_state.get("rev_all", 0.0)
-
-with tab_spending:
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        st.markdown("### Adjust Spending by Fund Category")
-    with col2:
-        spend_all = st.number_input("Adjust All (%)", min_value=-100.0, max_value=100.0, value=spend_all, step=1.0, format="%.1f", key="spend_all")
-
-    for category in grouped_df['Fund Category Name'].unique():
-        label = f"{category}"
-        if category in category_info:
-            label += f"  ℹ️"
-            st.markdown(f"<span style='display:inline-flex; align-items:center; gap:8px;'>"
-            f"<b>{category}</b>"
-            f"<span title='{category_info[category]}' style='cursor:help;'>"
-            f"<span style='display:inline-block; width:16px; height:16px; border-radius:50%; border:1px solid #888; background-color:transparent; text-align:center; line-height:14px; font-size:12px;'>i</span>"
-            f"</span></span>", unsafe_allow_html=True)
-        cat_pct = st.number_input(
-            f"{category} (% change)",
-            min_value=-100.0,
-            max_value=100.0,
-            value=spend_all,
-            step=1.0,
-            format="%.1f",
-            key=f"spend_cat_{category}"
-        )
-        category_adjustments[category] = cat_pct
-        with st.expander(f"Drill down into {category}"):
-            funds = grouped_df[grouped_df['Fund Category Name'] == category]['Fund Name'].unique()
-            for fund in funds:
-                fund_pct = st.number_input(
-                    f"{fund} (% change)",
-                    min_value=-100.0,
-                    max_value=100.0,
-                    value=0.0,
-                    step=1.0,
-                    format="%.1f",
-                    key=f"spend_fund_{category}_{fund}"
-                )
-                if fund_pct != 0:
-                    fund_adjustments[fund] = fund_pct
-
-with tab_revenue:
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        st.markdown("### Adjust Revenue by Fund Category")
-    with col2:
-        rev_all = st.number_input("Adjust All (%)", min_value=-100.0, max_value=100.0, value=rev_all, step=1.0, format="%.1f", key="rev_all")
-
-    for category in revenue_fund_cats:
-        if category in category_info:
-            st.markdown(f"<span style='display:inline-flex; align-items:center; gap:8px;'>"
-            f"<b>{category}</b>"
-            f"<span title='{category_info[category]}' style='cursor:help;'>"
-            f"<span style='display:inline-block; width:16px; height:16px; border-radius:50%; border:1px solid #888; background-color:transparent; text-align:center; line-height:14px; font-size:12px;'>i</span>"
-            f"</span></span>", unsafe_allow_html=True)
-        cat_pct = st.number_input(
-            f"{category} (% change)",
-            min_value=-100.0,
-            max_value=100.0,
-            value=rev_all,
-            step=1.0,
-            format="%.1f",
-            key=f"rev_cat_{category}"
-        )
-        category_adjustments[category] = cat_pct
-        with st.expander(f"Drill down into {category}"):
-            funds = grouped_df[grouped_df['Fund Category Name'] == category]['Fund Name'].unique()
-            for fund in funds:
-                fund_pct = st.number_input(
-                    f"{fund} (% change)",
-                    min_value=-100.0,
-                    max_value=100.0,
-                    value=0.0,
-                    step=1.0,
-                    format="%.1f",
-                    key=f"rev_fund_{category}_{fund}"
-                )
-                if fund_pct != 0:
-                    fund_adjustments[fund] = fund_pct
+# One editable row per fund; edits come back as a single table delta
+fund_adjustment_rows = grouped_df[['Fund Category Name', 'Fund Name']]
+fund_adjustment_config = {
+    '% change': st.column_config.NumberColumn(min_value=-100.0, max_value=100.0, step=1.0, format="%.1f", required=True, default=0.0)
+}
 
-# ─────────────────────────────────────────────
-# Calculate Totals
-# ─────────────────────────────────────────────
-adjusted_revenue = 0
-adjusted_spending = 0
+def fund_drilldown(prefix, rows):
+    # The fund table is only built while the expander is open; overrides are kept
+    # in session state so they survive while it is collapsed
+    overrides = st.session_state.get(f"{prefix}_fund_overrides", {})
+    with st.expander("Drill down into individual funds", key=f"{prefix}_funds_open", on_change="rerun") as drilldown:
+        if drilldown.open:
+            edited = st.data_editor(
+                rows.assign(**{'% change': rows['Fund Name'].map(overrides).astype(float).fillna(0.0)}),
+                column_config=fund_adjustment_config,
+                disabled=['Fund Category Name', 'Fund Name'],
+                hide_index=True,
+                width='stretch',
+                key=f"{prefix}_funds"
+            )
+            fund_pct = edited['% change'].fillna(0.0)
+            changed = fund_pct != 0
+            st.session_state[f"{prefix}_fund_overrides"] = dict(zip(edited.loc[changed, 'Fund Name'], fund_pct[changed]))
 
-for _, row in grouped_df.iterrows():
-    fund_cat = row['Fund Category Name']
-    fund_name = row['Fund Name']
-    value = row['FY25 Act Approp (M)']
-    pct = fund_adjustments.get(fund_name, category_adjustments.get(fund_cat, 0))
+def _totals(vals, pct, is_rev):
+    # Plain-array kernel over float32 values/pct and a bool revenue mask:
+    # returns (adjusted revenue, adjusted spending)
+    factors = 1.0 + pct * 0.01
+    return np.dot(vals * factors, is_rev), np.dot(vals, factors)
 
-    if fund_cat in revenue_fund_cats:
-        adjusted_revenue += value * (1 + pct / 100)
-    adjusted_spending += value * (1 + pct / 100)
+# Only this panel reruns when an adjustment changes; the treemap above stays as rendered
+@st.fragment
+def adjustments_panel():
+    tab_spending, tab_revenue = st.tabs(["Adjust Spending", "Adjust Revenue"])
 
-original_revenue = df[df['Fund Category Name'].isin(revenue_fund_cats)]['FY25 Act Approp (M)'].sum()
-original_spending = df['FY25 Act Approp (M)'].sum()
-original_deficit = original_revenue - original_spending
-adjusted_deficit = adjusted_revenue - adjusted_spending
+    spend_all = st.session_state.get("spend_all", 0.0)
+    rev_all = st.session_state.get("rev_all", 0.0)
 
-# ─────────────────────────────────────────────
-# Sidebar Budget Overview + Adjustment Log
-# ─────────────────────────────────────────────
-with st.sidebar:
-    st.subheader("Budget Overview (in Billions)")
-
-    for label, before, after in zip(
-        ['Revenue', 'Spending', 'Deficit'],
-        [original_revenue, original_spending, original_deficit],
-        [adjusted_revenue, adjusted_spending, adjusted_deficit]
-    ):
-        st.markdown(f"**{label}**")
-
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=[before],
-            y=['Before'],
-            orientation='h',
-            name='Before',
-            text=[f"${before/1000:.2f}B"],
-            textposition='auto',
-            marker=dict(color='lightgray')
-        ))
-        fig.add_trace(go.Bar(
-            x=[after],
-            y=['After'],
-            orientation='h',
-            name='After',
-            text=[f"${after/1000:.2f}B"],
-            textposition='auto',
-            marker=dict(color='steelblue')
-        ))
-        fig.update_layout(
-            height=120,
-            margin=dict(l=30, r=30, t=10, b=10),
-            barmode='group',
-            xaxis=dict(visible=False),
-            yaxis=dict(showticklabels=True, title=''),
-            showlegend=False
-        )
-        st.plotly_chart(fig, use_container_width=True)
-
-    st.subheader("Adjustment Log")
-    any_changes = False
-    for fund_cat, pct in category_adjustments.items():
-        if pct != 0:
+    with tab_spending:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown("### Adjust Spending by Fund Category")
+        with col2:
+            spend_all = st.number_input("Adjust All (%)", min_value=-100.0, max_value=100.0, value=spend_all, step=1.0, format="%.1f", key="spend_all")
+
+        for category in categories:
+            if category in category_info:
+                st.markdown(TOOLTIP_HTML[category], unsafe_allow_html=True)
+            st.number_input(
+                f"{category} (% change)",
+                min_value=-100.0,
+                max_value=100.0,
+                value=spend_all,
+                step=1.0,
+                format="%.1f",
+                key=f"spend_cat_{category}"
+            )
+
+        fund_drilldown("spend", fund_adjustment_rows)
+
+    with tab_revenue:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown("### Adjust Revenue by Fund Category")
+        with col2:
+            rev_all = st.number_input("Adjust All (%)", min_value=-100.0, max_value=100.0, value=rev_all, step=1.0, format="%.1f", key="rev_all")
+
+        for category in revenue_fund_cats:
+            if category in category_info:
+                st.markdown(TOOLTIP_HTML[category], unsafe_allow_html=True)
+            st.number_input(
+                f"{category} (% change)",
+                min_value=-100.0,
+                max_value=100.0,
+                value=rev_all,
+                step=1.0,
+                format="%.1f",
+                key=f"rev_cat_{category}"
+            )
+
+        fund_drilldown("rev", fund_adjustment_rows[is_rev])
+
+    # ─────────────────────────────────────────────
+    # Collect Adjustments from Session State
+    # ─────────────────────────────────────────────
+    # Revenue-tab values override spending-tab values for the same category/fund
+    category_adjustments = {
+        category: st.session_state.get(f"spend_cat_{category}", 0.0)
+        for category in categories
+    }
+    category_adjustments.update({
+        category: st.session_state.get(f"rev_cat_{category}", 0.0)
+        for category in revenue_fund_cats
+    })
+
+    fund_adjustments = {
+        **st.session_state.get("spend_fund_overrides", {}),
+        **st.session_state.get("rev_fund_overrides", {}),
+    }
+
+    # ─────────────────────────────────────────────
+    # Calculate Totals
+    # ─────────────────────────────────────────────
+    if not any(category_adjustments.values()) and not fund_adjustments:
+        adjusted_revenue, adjusted_spending = original_revenue, original_spending
+    else:
+        category_pct_series = grouped_df['Fund Category Name'].map(category_adjustments).astype(float).fillna(0.0)
+        fund_pct_series = grouped_df['Fund Name'].map(fund_adjustments).astype(float)
+        pct = fund_pct_series.where(fund_pct_series.notna(), category_pct_series).to_numpy(dtype=np.float32)
+
+        adjusted_revenue, adjusted_spending = _totals(fund_values, pct, is_rev)
+
+    original_deficit = original_revenue - original_spending
+    adjusted_deficit = adjusted_revenue - adjusted_spending
+
+    # ─────────────────────────────────────────────
+    # Sidebar Budget Overview + Adjustment Log
+    # ─────────────────────────────────────────────
+    with st.sidebar:
+        st.subheader("Budget Overview (in Billions)")
+
+        for label, before, after, delta_color in zip(
+            ['Revenue', 'Spending', 'Deficit'],
+            [original_revenue, original_spending, original_deficit],
+            [adjusted_revenue, adjusted_spending, adjusted_deficit],
+            ['normal', 'inverse', 'normal']
+        ):
+            # Hide the delta when it rounds to zero; any non-empty string counts as a change
+            delta = round(float(after - before) / 1000, 2)
+            st.metric(
+                label,
+                f"${after/1000:.2f}B",
+                delta=f"{delta:+.2f}B" if delta != 0 else None,
+                delta_color=delta_color,
+                help=f"Before adjustments: ${before/1000:.2f}B"
+            )
+
+        st.subheader("Adjustment Log")
+        any_changes = False
+        for fund_cat, pct in category_adjustments.items():
+            if pct != 0:
+                color = 'green' if pct > 0 else 'red'
+                st.markdown(f"**{fund_cat}:** <span style='color:{color}'>{pct:+.1f}%</span>", unsafe_allow_html=True)
+                any_changes = True
+        for fund_name, pct in fund_adjustments.items():
             color = 'green' if pct > 0 else 'red'
-            st.markdown(f"**{fund_cat}:** <span style='color:{color}'>{pct:+.1f}%</span>", unsafe_allow_html=True)
+            st.markdown(f"**{fund_name}:** <span style='color:{color}'>{pct:+.1f}%</span>", unsafe_allow_html=True)
             any_changes = True
-    for fund_name, pct in fund_adjustments.items():
-        color = 'green' if pct > 0 else 'red'
-        st.markdown(f"**{fund_name}:** <span style='color:{color}'>{pct:+.1f}%</span>", unsafe_allow_html=True)
-        any_changes = True
-    if not any_changes:
-        st.write("No adjustments yet.")
-
-    if st.button("Reset All Adjustments"):
-        for key in st.session_state.keys():
-            del st.session_state[key]
-        st.rerun()
+        if not any_changes:
+            st.write("No adjustments yet.")
+
+        if st.button("Reset All Adjustments"):
+            keys_to_clear = [key for key in st.session_state if key.startswith(('spend_', 'rev_'))]
+            for key in keys_to_clear:
+                del st.session_state[key]
+            st.rerun()
+
+adjustments_panel()